@@ -0,0 +1,2 @@
+# Makes the repository root importable under pytest, so tests can import
+# the src.workflow.* / src.llm.* modules the same way the demos do.
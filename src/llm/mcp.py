@@ -1,16 +1,55 @@
 from mcp.server.fastmcp import FastMCP
-import sympy as sp
-import numpy as np
-import requests
-from typing import List, Optional
+from cachetools import TTLCache
+from typing import Any, List, Optional, Tuple
+import ast
 import io
 import base64
-import matplotlib.pyplot as plt
-import plotly.express as px
 import json
+import asyncio
+import contextlib
+import threading
 import urllib.parse
+import weakref
+from functools import lru_cache
 
-mcp = FastMCP("Math Tools MCP Server")
+# Heavy libraries (sympy, numpy, httpx, matplotlib, plotly) are imported inside
+# the tools that use them, so starting the server only pays for what is called.
+
+# Pooled HTTP clients for the web-backed tools: keep-alive connections (HTTP/2
+# where the server supports it) instead of a new TCP+TLS handshake per call.
+# An AsyncClient is bound to the event loop that opened its connections, so
+# there is one per running loop, created on first use and dropped with the loop.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+# Server sessions (lifespans) currently running on each loop
+_lifespan_users: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, int]" = weakref.WeakKeyDictionary()
+
+@contextlib.asynccontextmanager
+async def _lifespan(server):
+    """Close the loop's HTTP client, on that loop, when its last server session ends."""
+    loop = asyncio.get_running_loop()
+    _lifespan_users[loop] = _lifespan_users.get(loop, 0) + 1
+    try:
+        yield {}
+    finally:
+        _lifespan_users[loop] -= 1
+        if not _lifespan_users[loop]:
+            del _lifespan_users[loop]
+            await aclose_http_client()
+
+async def aclose_http_client():
+    """Close the running loop's pooled HTTP client, if it has one."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+mcp = FastMCP("Math Tools MCP Server", lifespan=_lifespan)
+
+# Figure reused across matplotlib_plot calls (OO API, no pyplot state); the
+# lock serialises access in case tools are run from worker threads.
+_figure = None
+_plot_lock = threading.Lock()
+# Successful WolframAlpha answers keyed on (query, app_id); math queries repeat often.
+_wolfram_cache: TTLCache = TTLCache(maxsize=1024, ttl=3600)
 
 @mcp.tool(title="Symbolic Math (SymPy)", description="Evaluate symbolic math expressions using SymPy.")
 def sympy_eval(expr: str) -> str:
@@ -21,12 +60,45 @@ def sympy_eval(expr: str) -> str:
     Returns:
         The simplified result as a string, or an error message.
     """
+    ok, value = _sympify_cached(expr)
+    if not ok:
+        return value
     try:
-        result = sp.sympify(expr)
-        return str(sp.simplify(result))
+        if value is None:
+            # not a hashable SymPy expression (Matrix, list, dict, ...): these
+            # may be mutable, so parse afresh and simplify without caching
+            import sympy as sp
+
+            return str(sp.simplify(sp.sympify(expr, evaluate=True)))
+        return _simplify_cached(value)
     except Exception as e:
         return f"SymPy error: {e}"
 
+@lru_cache(maxsize=10_000)
+def _sympify_cached(expr: str) -> Tuple[bool, Any]:
+    """Parse `expr` once per distinct string.
+
+    Returns (True, expression) for a SymPy Basic, (True, None) for any other
+    parse result (never cached or shared, since it may be mutable), or
+    (False, error message); parse failures are cached too, so repeated bad
+    input does not re-enter the SymPy parser.
+    """
+    try:
+        import sympy as sp
+
+        parsed = sp.sympify(expr, evaluate=True)
+    except Exception as e:
+        return False, f"SymPy error: {e}"
+    return True, parsed if isinstance(parsed, sp.Basic) else None
+
+@lru_cache(maxsize=10_000)
+def _simplify_cached(parsed) -> str:
+    # keyed on the expression object, not its string: equality includes symbol
+    # assumptions, so Symbol('x', positive=True) and Symbol('x') stay distinct
+    import sympy as sp
+
+    return str(sp.simplify(parsed))
+
 @mcp.tool(title="Numeric Math (NumPy)", description="Evaluate numeric expressions using NumPy.")
 def numpy_eval(expr: str) -> str:
     """
@@ -36,13 +108,99 @@ def numpy_eval(expr: str) -> str:
     Returns:
         The result as a string, or an error message.
     """
+    import numpy as np
+
     try:
-        return str(eval(expr, {"np": np, "__builtins__": {}}))
+        # NumPy's C code imports lazily through the calling frame's builtins, so
+        # __import__ must be present; the expression itself cannot name it
+        return str(eval(_compile_numpy_expr(expr), {"np": np, "__builtins__": {"__import__": __import__}}))
     except Exception as e:
         return f"NumPy error: {e}"
 
+# AST nodes numpy_eval accepts: arithmetic, comparisons, calls, literals and
+# indexing. Names and attributes are checked separately against the allowlists
+# below, since any other attribute chain can walk from numpy into modules such
+# as os or ctypes (np.f2py.os, np.ctypeslib.ctypes).
+_NUMPY_EVAL_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp,
+    ast.Call, ast.keyword, ast.Constant,
+    ast.Tuple, ast.List, ast.Subscript, ast.Slice, ast.Load,
+    ast.operator, ast.unaryop, ast.boolop, ast.cmpop,
+)
+
+# `np.<name>` functions and constants numpy_eval may use (dotted for submodules)
+_NUMPY_EVAL_NAMES = frozenset("""
+    pi e inf nan euler_gamma newaxis float32 float64 int32 int64 complex128
+    sin cos tan arcsin arccos arctan arctan2 sinh cosh tanh arcsinh arccosh arctanh
+    exp exp2 expm1 log log2 log10 log1p sqrt cbrt square abs absolute fabs sign
+    floor ceil round rint trunc mod remainder fmod power hypot degrees radians
+    deg2rad rad2deg maximum minimum clip isnan isinf isfinite isclose allclose gcd lcm
+    sum prod mean median std var min max amin amax argmin argmax cumsum cumprod
+    average ptp all any count_nonzero
+    array asarray arange linspace logspace zeros ones full eye identity diag
+    reshape transpose concatenate stack hstack vstack flip sort argsort unique where
+    dot vdot inner outer cross matmul tensordot trace diff gradient trapezoid
+    polyval polyfit roots poly convolve interp
+    linalg.norm linalg.det linalg.inv linalg.solve linalg.eig linalg.eigvals
+    linalg.eigh linalg.svd linalg.matrix_rank linalg.pinv linalg.qr
+    linalg.cholesky linalg.lstsq linalg.matrix_power
+""".split())
+
+# Attributes allowed on computed values (arrays and NumPy scalars)
+_NUMPY_EVAL_METHODS = frozenset("""
+    T shape ndim size real imag sum prod mean std var min max argmin argmax
+    cumsum cumprod reshape transpose flatten dot round conj tolist item
+""".split())
+
+def _numpy_dotted_name(node: ast.Attribute) -> Optional[str]:
+    """'linalg.norm' for np.linalg.norm; None if the chain is not rooted at np."""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name) and node.id == "np":
+        return ".".join(reversed(parts))
+    return None
+
+def _check_numpy_node(node: ast.AST) -> None:
+    if isinstance(node, ast.Attribute):
+        dotted = _numpy_dotted_name(node)
+        if dotted is not None:
+            if dotted not in _NUMPY_EVAL_NAMES:
+                raise ValueError(f"np.{dotted} is not allowed")
+            return
+        if node.attr not in _NUMPY_EVAL_METHODS:
+            raise ValueError(f"attribute not allowed: {node.attr}")
+        _check_numpy_node(node.value)
+        return
+    if isinstance(node, ast.Name):
+        # `np` is only valid as the root of an allowed np.<name>
+        raise ValueError(f"name not allowed: {node.id}")
+    if not isinstance(node, _NUMPY_EVAL_NODES):
+        raise ValueError(f"unsupported syntax: {type(node).__name__}")
+    for child in ast.iter_child_nodes(node):
+        _check_numpy_node(child)
+
+@lru_cache(maxsize=1024)
+def _compile_numpy_expr(expr: str):
+    """Validate and compile a numpy_eval expression; cached so repeats skip parsing."""
+    tree = ast.parse(expr, mode="eval")
+    _check_numpy_node(tree)
+    return compile(tree, "<numpy_eval>", "eval")
+
+def _http_client():
+    """Return the pooled client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        import httpx
+
+        client = httpx.AsyncClient(http2=True, timeout=10.0, limits=httpx.Limits(max_keepalive_connections=32))
+        _clients[loop] = client
+    return client
+
 @mcp.tool(title="WolframAlpha", description="Query WolframAlpha for math answers.")
-def wolfram_query(query: str, app_id: str) -> str:
+async def wolfram_query(query: str, app_id: str) -> str:
     """
     Query WolframAlpha for a math answer.
     Args:
@@ -51,15 +209,24 @@ def wolfram_query(query: str, app_id: str) -> str:
     Returns:
         The result as a string, or an error message.
     """
+    key = (query, app_id)
+    if key in _wolfram_cache:
+        return _wolfram_cache[key]
     endpoint = "http://api.wolframalpha.com/v1/result"
     params = {"i": query, "appid": app_id}
-    resp = requests.get(endpoint, params=params)
+    import httpx
+
+    try:
+        resp = await _http_client().get(endpoint, params=params)
+    except httpx.HTTPError as e:
+        return f"WolframAlpha error: {e}"
     if resp.status_code == 200:
+        _wolfram_cache[key] = resp.text
         return resp.text
     return f"WolframAlpha error: {resp.text}"
 
 @mcp.tool(title="MathJS", description="Evaluate math expressions using the MathJS API.")
-def mathjs_eval(expr: str) -> str:
+async def mathjs_eval(expr: str) -> str:
     """
     Evaluate a math expression using the MathJS API.
     Args:
@@ -68,11 +235,27 @@ def mathjs_eval(expr: str) -> str:
         The result as a string, or an error message.
     """
     endpoint = "https://api.mathjs.org/v4/"
-    resp = requests.post(endpoint, json={"expr": expr})
+    import httpx
+
+    try:
+        resp = await _http_client().post(endpoint, json={"expr": expr})
+    except httpx.HTTPError as e:
+        return f"MathJS error: {e}"
     if resp.status_code == 200:
         return resp.text
     return f"MathJS error: {resp.text}"
 
+def _matplotlib_axes():
+    """Return the (Axes, canvas) pair reused by matplotlib_plot, creating it on first use."""
+    global _figure
+    if _figure is None:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        fig = Figure()
+        _figure = (fig.add_subplot(111), FigureCanvasAgg(fig))
+    return _figure
+
 @mcp.tool(title="Matplotlib Plot", description="Create a plot using Matplotlib and return as a base64 PNG.")
 def matplotlib_plot(x: List[float], y: List[float], plot_type: str = "line") -> str:
     """
@@ -84,16 +267,17 @@ def matplotlib_plot(x: List[float], y: List[float], plot_type: str = "line") ->
     Returns:
         The plot as a base64-encoded PNG image string.
     """
-    plt.figure()
-    if plot_type == "scatter":
-        plt.scatter(x, y)
-    else:
-        plt.plot(x, y)
-    plt.xlabel("x")
-    plt.ylabel("y")
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png")
-    plt.close()
+    with _plot_lock:
+        ax, canvas = _matplotlib_axes()
+        ax.cla()
+        if plot_type == "scatter":
+            ax.scatter(x, y)
+        else:
+            ax.plot(x, y)
+        ax.set_xlabel("x")
+        ax.set_ylabel("y")
+        buf = io.BytesIO()
+        canvas.print_png(buf)
     buf.seek(0)
     img_base64 = base64.b64encode(buf.read()).decode("utf-8")
     return img_base64
@@ -109,6 +293,8 @@ def plotly_plot(x: List[float], y: List[float], plot_type: str = "line") -> str:
     Returns:
         The plot as a base64-encoded PNG image string.
     """
+    import plotly.express as px
+
     if plot_type == "scatter":
         fig = px.scatter(x=x, y=y)
     else:
@@ -144,6 +330,18 @@ def geogebra_graph(expression: str) -> str:
     base_url = "https://www.geogebra.org/graphing"
     return base_url
 
+# Tools exposed to other orchestrators (e.g. the LangGraph wrapper in src/workflow/graph.py)
+EXPORTED_TOOLS = [
+    sympy_eval,
+    numpy_eval,
+    wolfram_query,
+    mathjs_eval,
+    matplotlib_plot,
+    plotly_plot,
+    desmos_graph,
+    geogebra_graph,
+]
+
 def run_server():
     """Run the MCP server. Call this from another file to start the server."""
     mcp.run()
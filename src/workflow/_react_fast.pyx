@@ -0,0 +1,55 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""Compiled problem decomposition for ReActPlanner.
+
+Same output as the pure-Python `ReActPlanner._decompose_steps`, but the
+sentence split and math detection are a single typed character scan instead
+of a regex pass. Optional; build in place from the repository root with:
+
+    cythonize -i src/workflow/_react_fast.pyx
+"""
+
+from cpython.unicode cimport Py_UNICODE_ISSPACE
+
+
+cdef inline bint _is_math(Py_UCS4 c):
+    return c in u'0123456789=+-*/^()'
+
+
+cdef inline bint _is_end(Py_UCS4 c):
+    return c == u'.' or c == u'?' or c == u'!'
+
+
+cpdef list decompose(str problem, str rag_flat):
+    """Split `problem` into steps, preceded by the RAG hint if `rag_flat` is set."""
+    cdef list steps = []
+    cdef Py_ssize_t i = 0, start, n = len(problem)
+    cdef bint math
+    cdef Py_UCS4 c
+    cdef str s, p
+    if rag_flat:
+        steps.append("Consult relevant formulas and proofs: " + rag_flat)
+    while i < n:
+        # sentences are separated by whitespace following . ? or !
+        while i < n and Py_UNICODE_ISSPACE(problem[i]):
+            i += 1
+        if i == n:
+            break
+        start = i
+        math = False
+        while i < n:
+            c = problem[i]
+            i += 1
+            if _is_math(c):
+                math = True
+            elif _is_end(c) and i < n and Py_UNICODE_ISSPACE(problem[i]):
+                break
+        s = problem[start:i].rstrip()
+        # equation-like sentences stay whole; others split on commas
+        if math or ',' not in s:
+            steps.append(s)
+        else:
+            for p in s.split(','):
+                p = p.strip()
+                if p:
+                    steps.append(p)
+    return steps
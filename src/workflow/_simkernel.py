@@ -0,0 +1,89 @@
+"""Similarity-scan kernels used by MemoryStore retrieval.
+
+`masked_scores` computes the dot product of every stored (normalized)
+embedding row with a normalized query, skipping rows whose interned owner id
+does not match. Rows may be float32 or int8 (quantized); for int8 the raw
+integer dot product is returned and the caller applies the scales.
+
+Unfiltered float32 scans (including a filter every row passes, as in a
+single-owner store) use a BLAS matrix-vector product. Scans that drop rows,
+or read int8 rows, use a serial Numba loop when Numba is installed (cached on
+disk so the JIT cost is paid once): it only touches the owner's rows and
+never widens the matrix. The loop is deliberately not `parallel=True`, whose
+threading layers cannot be entered from several Python threads at once.
+Without Numba those scans gather the owner's rows and fall back to NumPy.
+"""
+
+import numpy as np
+
+
+_BLOCK_ROWS = 4096
+
+
+def topk(scores: np.ndarray, k: int) -> np.ndarray:
+	"""Return indices of the k highest scores, best first; equal scores go to
+	the lower index, as with a stable sort."""
+	n = scores.shape[0]
+	k = min(k, n)
+	if k <= 0:
+		return np.empty(0, dtype=np.intp)
+	if k < n:
+		# partition only finds the k-th best score; take every row scoring at
+		# least that so rows tied at the cut compete on index, not on chance
+		kth = -np.partition(-scores, k - 1)[k - 1]
+		top = np.flatnonzero(scores >= kth)
+	else:
+		top = np.arange(n)
+	return top[np.lexsort((top, -scores[top]))][:k]
+
+
+try:
+	from numba import njit
+
+	@njit(cache=True, fastmath=True)
+	def _kernel_scores(mat, q, owners, owner_id):
+		n, d = mat.shape
+		out = np.zeros(n, dtype=np.float64)
+		for i in range(n):
+			if owner_id >= 0 and owners[i] != owner_id:
+				continue
+			s = 0.0
+			for j in range(d):
+				s += mat[i, j] * q[j]
+			out[i] = s
+		return out
+
+except ImportError:
+	_kernel_scores = None
+
+
+def _dense_scores(mat: np.ndarray, q: np.ndarray) -> np.ndarray:
+	if mat.dtype == np.float32:
+		return (mat @ q).astype(np.float64)
+	# integer (quantized) rows: widen in cache-sized blocks rather than
+	# copying the whole matrix, and avoid int8 overflow in the product
+	out = np.empty(mat.shape[0], dtype=np.float64)
+	qf = q.astype(np.float32)
+	for start in range(0, mat.shape[0], _BLOCK_ROWS):
+		out[start:start + _BLOCK_ROWS] = mat[start:start + _BLOCK_ROWS].astype(np.float32) @ qf
+	return out
+
+
+def masked_scores(mat: np.ndarray, q: np.ndarray, owners: np.ndarray, owner_id: int) -> np.ndarray:
+	"""Score rows of `mat` against `q`; rows of other owners score 0.
+
+	owner_id < 0 disables the owner filter. Safe to call from several threads.
+	"""
+	keep = None
+	if owner_id >= 0:
+		keep = owners == owner_id
+		if keep.all():
+			owner_id, keep = -1, None
+	if _kernel_scores is not None and (keep is not None or mat.dtype != np.float32):
+		return _kernel_scores(mat, q, owners, owner_id)
+	if keep is None:
+		return _dense_scores(mat, q)
+	out = np.zeros(mat.shape[0], dtype=np.float64)
+	rows = np.flatnonzero(keep)
+	out[rows] = _dense_scores(mat[rows], q)
+	return out
@@ -1,33 +1,14 @@
 # LangGraph-style orchestration for math problem solving
 from typing import Optional, Any
+import asyncio
+import inspect
 import json
+import threading
 import time
 
-# Dynamic loaders to reuse local modules
-import importlib.util
-import pathlib
-
-
-def _load(path_parts, attr=None):
-	base = pathlib.Path(__file__).resolve().parent
-	candidate = base
-	for p in path_parts:
-		candidate = candidate / p
-	if not candidate.exists():
-		candidate = base.parent.parent / 'src'
-		for p in path_parts:
-			candidate = candidate / p
-	spec = importlib.util.spec_from_file_location('_mod', str(candidate))
-	mod = importlib.util.module_from_spec(spec)
-	loader = spec.loader
-	loader.exec_module(mod)
-	return getattr(mod, attr) if attr else mod
-
-
-# Load components
-RAGManager = _load(['workflow', 'rag.py'], 'RAGManager')
-ReActPlanner = _load(['workflow', 'react.py'], 'ReActPlanner')
-MemoryStore = _load(['memory', 'memory.py'], 'MemoryStore')
+from src.workflow.rag import RAGManager
+from src.workflow.react import ReActPlanner
+from src.workflow.memory import MemoryStore
 
 
 class LangGraphSystem:
@@ -37,14 +18,23 @@ class LangGraphSystem:
 		self.planner = ReActPlanner(embedding_fn=embedding_fn, embedding_dim=embedding_dim)
 
 	def ingest_domain_docs(self, docs: dict):
-		for doc_id, text in docs.items():
-			self.rag.add_global_document(doc_id, text)
+		self.rag.add_global_documents_bulk(docs)
 
 	def solve(self, problem: str, user_id: Optional[str] = None, verify: bool = True):
 		# Use planner to create a plan
 		plan = self.planner.plan(problem, user_id=user_id, verify=verify)
 		return plan
 
+	def close(self):
+		"""Release the planner's worker threads."""
+		self.planner.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
 
 if __name__ == '__main__':
 	print('LangGraphSystem demo')
@@ -85,13 +75,21 @@ try:
 
 				tools.append(ToolCls(name='rag_lookup', func=rag_lookup, description='Retrieve relevant documents from RAG'))
 
-				# Register available MCP tools from the mcp module
-				mcp_mod = _load(['llm', 'mcp.py'])
-				mcp_tool_names = [n for n in dir(mcp_mod) if n.endswith('_eval') or n.endswith('_query') or n.endswith('_plot')]
-				for name in mcp_tool_names:
-					func = getattr(mcp_mod, name)
+				# Register the MCP tools exported by the mcp module
+				from src.llm.mcp import EXPORTED_TOOLS
+				# async tools (the web-backed ones) run on one background loop, so
+				# their pooled HTTP client is reused and callers get the result
+				# rather than a coroutine, whether or not they run a loop themselves;
+				# close() closes that client and stops the loop
+				self._tool_loop = asyncio.new_event_loop()
+				self._tool_thread = threading.Thread(target=self._tool_loop.run_forever, name='mcp-tools', daemon=True)
+				self._tool_thread.start()
+				for func in EXPORTED_TOOLS:
+					name = func.__name__
 					# wrap to a uniform signature
 					def make_tool(f):
+						if inspect.iscoroutinefunction(f):
+							return lambda *a, **k: asyncio.run_coroutine_threadsafe(f(*a, **k), self._tool_loop).result()
 						return lambda *a, **k: f(*a, **k)
 					tools.append(ToolCls(name=name, func=make_tool(func), description=f'MCP tool: {name}'))
 
@@ -113,6 +111,23 @@ try:
 		def ingest_domain_docs(self, docs: dict):
 			self.system.ingest_domain_docs(docs)
 
+		def close(self):
+			"""Close the async tools' HTTP client on their loop, then stop the loop."""
+			loop = getattr(self, '_tool_loop', None)
+			if loop is not None and not loop.is_closed():
+				from src.llm.mcp import aclose_http_client
+				asyncio.run_coroutine_threadsafe(aclose_http_client(), loop).result()
+				loop.call_soon_threadsafe(loop.stop)
+				self._tool_thread.join()
+				loop.close()
+			self.system.close()
+
+		def __enter__(self):
+			return self
+
+		def __exit__(self, *exc):
+			self.close()
+
 		def solve(self, problem: str, user_id: Optional[str] = None, verify: bool = True):
 			# Prefer running via langgraph graph if available
 			if self.graph and hasattr(self.graph, 'run'):
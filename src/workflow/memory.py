@@ -5,26 +5,83 @@ Provides an in-memory MemoryStore that stores conversation turns and user
 profiles, optional embeddings (via Azure OpenAI) and simple similarity
 retrieval for memory-based prompts.
 
-This is intentionally lightweight and dependency-free by default. If you
-want vector similarity using OpenAI embeddings, pass an embedding function
-when constructing MemoryStore.
+This is intentionally lightweight and only depends on NumPy. If you want
+vector similarity using OpenAI embeddings, pass an embedding function when
+constructing MemoryStore.
 """
 
-from typing import List, Dict, Optional, Callable, Tuple
+from typing import List, Dict, Optional, Callable, Tuple, Set
+from collections import OrderedDict
 import time
-import math
 import os
+import re
+import hashlib
+import threading
 
+import numpy as np
 
-def _cosine_similarity(a: List[float], b: List[float]) -> float:
-	if not a or not b or len(a) != len(b):
-		return 0.0
-	dot = sum(x * y for x, y in zip(a, b))
-	na = math.sqrt(sum(x * x for x in a))
-	nb = math.sqrt(sum(y * y for y in b))
-	if na == 0 or nb == 0:
-		return 0.0
-	return dot / (na * nb)
+from src.workflow._simkernel import masked_scores, topk
+
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _text_hash(text: str) -> bytes:
+	return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+def _quantize(v: np.ndarray) -> Tuple[np.ndarray, float]:
+	"""Symmetric int8 quantization: returns (q, scale) with v ~= q * scale."""
+	m = float(np.max(np.abs(v)))
+	if m == 0:
+		return np.zeros(v.shape, dtype=np.int8), 0.0
+	scale = m / 127.0
+	return np.round(v / scale).astype(np.int8), scale
+
+
+def _lexical_score(q: str, q_words: Set[str], q_len: int, text: str) -> float:
+	"""Crude substring / token overlap score used when embeddings are unavailable."""
+	t = text.lower()
+	if q in t:
+		return 1.0
+	# small boost for partial word overlaps
+	common = sum(1 for w in q_words if w in t)
+	return common / max(1, q_len) * 0.1
+
+
+class EmbeddingCache:
+	"""Bounded, thread-safe LRU mapping text hashes to embeddings.
+
+	Shared by every store of a RAGManager (and the planner's memory), so it is
+	capped: each query embedding is cached too, and a long-running process
+	sees an unbounded stream of distinct queries.
+	"""
+
+	def __init__(self, maxsize: int = 2048):
+		self.maxsize = maxsize
+		self._data: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key: bytes) -> Optional[np.ndarray]:
+		with self._lock:
+			emb = self._data.get(key)
+			if emb is not None:
+				self._data.move_to_end(key)
+			return emb
+
+	def __contains__(self, key: bytes) -> bool:
+		with self._lock:
+			return key in self._data
+
+	def __setitem__(self, key: bytes, emb: np.ndarray):
+		with self._lock:
+			self._data[key] = emb
+			self._data.move_to_end(key)
+			if len(self._data) > self.maxsize:
+				self._data.popitem(last=False)
+
+	def __len__(self) -> int:
+		return len(self._data)
 
 
 class MemoryStore:
@@ -33,15 +90,41 @@ class MemoryStore:
 	Args:
 		embedding_fn: optional callable(text: str) -> List[float] to compute embeddings.
 		embedding_dim: optional embedding dimension (for validation).
+		embedding_cache: optional EmbeddingCache (or dict) mapping text hashes to
+			embeddings; pass the same one to several stores to share embeddings
+			of identical text. Defaults to a private EmbeddingCache.
+		quantize: store embeddings as int8 with a per-row scale (4x less memory
+			and bandwidth per scan, cosine error typically below 0.01).
 	"""
 
-	def __init__(self, embedding_fn: Optional[Callable[[str], List[float]]] = None, embedding_dim: Optional[int] = None):
+	def __init__(self, embedding_fn: Optional[Callable[[str], List[float]]] = None, embedding_dim: Optional[int] = None, embedding_cache: Optional[EmbeddingCache] = None, quantize: bool = False):
 		self.embedding_fn = embedding_fn
 		self.embedding_dim = embedding_dim
+		self.quantize = quantize
+		# text hash -> embedding, so identical texts are only embedded once
+		self._emb_cache = EmbeddingCache() if embedding_cache is None else embedding_cache
 		self.conversations: Dict[str, List[Dict]] = {}
 		self.profiles: Dict[str, Dict] = {}
-		# vector index: list of (id, owner, text, embedding, timestamp)
-		self.vectors: List[Tuple[str, str, str, Optional[List[float]], float]] = []
+		# vector index, stored column-wise: row i is (_ids[i], _owners[i],
+		# _texts[i], _hashes[i], _emb_matrix[i], _timestamps[i], _formatted_ts[i]).
+		# Embedding rows are L2-normalized (int8 times _scales[i] when
+		# quantized); array columns grow by doubling and only the first _n rows
+		# are valid. Owners are interned to int32 ids so the scan kernel can
+		# filter on them.
+		self._ids: List[str] = []
+		self._texts: List[str] = []
+		self._hashes: List[bytes] = []
+		self._formatted_ts: List[str] = []
+		self._owner_ids: Dict[str, int] = {}
+		self._owner_names: List[str] = []
+		self._owners = np.empty(0, dtype=np.int32)
+		self._timestamps = np.empty(0, dtype=np.float64)
+		self._has_emb = np.zeros(0, dtype=bool)
+		self._emb_matrix = np.empty((0, embedding_dim or 0), dtype=np.int8 if quantize else np.float32)
+		self._scales = np.empty(0, dtype=np.float32)
+		self._n = 0
+		# inverted index for the lexical fallback: lowercase token -> row indices
+		self._postings: Dict[str, Set[int]] = {}
 
 	# Conversation operations
 	def add_conversation_turn(self, convo_id: str, role: str, text: str, timestamp: Optional[float] = None):
@@ -49,22 +132,123 @@ class MemoryStore:
 
 		role: 'user'|'assistant'|'system'
 		"""
+		key = _text_hash(text)
+		self._append(convo_id, role, text, timestamp, key, self._embed(text, key))
+
+	def add_conversation_turns(self, convo_id: str, role: str, texts: List[str], timestamp: Optional[float] = None):
+		"""Add several turns to a conversation, embedding them in one batch.
+
+		Uses embedding_fn.batch(texts) when the embedding function provides it
+		(see make_azure_embedding_fn); otherwise texts are embedded one by one.
+		"""
+		keys = [_text_hash(text) for text in texts]
+		for text, key, emb in zip(texts, keys, self._embed_many(texts, keys)):
+			self._append(convo_id, role, text, timestamp, key, emb)
+
+	def _append(self, convo_id: str, role: str, text: str, timestamp: Optional[float], key: bytes, emb: Optional[np.ndarray]):
 		if timestamp is None:
 			timestamp = time.time()
 		turn = {"role": role, "text": text, "timestamp": timestamp}
 		self.conversations.setdefault(convo_id, []).append(turn)
 
-		emb = None
-		if self.embedding_fn:
+		if self._n == len(self._owners):
+			self._grow()
+		if emb is not None and self._emb_matrix.shape[1] == 0:
+			# first embedding fixes the dimension of the index
+			self._emb_matrix = np.zeros((len(self._owners), emb.size), dtype=self._emb_matrix.dtype)
+
+		if convo_id not in self._owner_ids:
+			self._owner_ids[convo_id] = len(self._owner_names)
+			self._owner_names.append(convo_id)
+
+		i = self._n
+		self._ids.append(f"turn:{convo_id}:{len(self.conversations[convo_id])-1}")
+		self._texts.append(text)
+		self._hashes.append(key)
+		self._formatted_ts.append(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)))
+		self._owners[i] = self._owner_ids[convo_id]
+		self._timestamps[i] = timestamp
+		self._has_emb[i] = emb is not None
+		if emb is not None:
+			norm = np.linalg.norm(emb)
+			row = emb / norm if norm > 0 else emb
+			if self.quantize:
+				self._emb_matrix[i], self._scales[i] = _quantize(row)
+			else:
+				self._emb_matrix[i] = row
+		for tok in set(_TOKEN_RE.findall(text.lower())):
+			self._postings.setdefault(tok, set()).add(i)
+		self._n += 1
+
+	def _grow(self):
+		capacity = max(16, 2 * len(self._owners))
+		owners = np.empty(capacity, dtype=np.int32)
+		owners[:self._n] = self._owners[:self._n]
+		timestamps = np.empty(capacity, dtype=np.float64)
+		timestamps[:self._n] = self._timestamps[:self._n]
+		has_emb = np.zeros(capacity, dtype=bool)
+		has_emb[:self._n] = self._has_emb[:self._n]
+		matrix = np.zeros((capacity, self._emb_matrix.shape[1]), dtype=self._emb_matrix.dtype)
+		matrix[:self._n] = self._emb_matrix[:self._n]
+		scales = np.zeros(capacity, dtype=np.float32)
+		scales[:self._n] = self._scales[:self._n]
+		self._owners, self._timestamps, self._has_emb, self._emb_matrix, self._scales = owners, timestamps, has_emb, matrix, scales
+
+	def _embed(self, text: str, key: Optional[bytes] = None) -> Optional[np.ndarray]:
+		"""Embed text as a float32 array, or None if embeddings are unavailable.
+
+		key: the text's _text_hash, if the caller already computed it.
+		"""
+		if not self.embedding_fn:
+			return None
+		if key is None:
+			key = _text_hash(text)
+		emb = self._emb_cache.get(key)
+		if emb is None:
 			try:
-				emb = self.embedding_fn(text)
-				if self.embedding_dim and len(emb) != self.embedding_dim:
-					# don't store invalid dims
-					emb = None
+				emb = np.asarray(self.embedding_fn(text), dtype=np.float32)
 			except Exception:
-				emb = None
+				return None
+			if emb.ndim != 1 or emb.size == 0:
+				return None
+			self._emb_cache[key] = emb
+		return self._check_dim(emb)
+
+	def _check_dim(self, emb: np.ndarray) -> Optional[np.ndarray]:
+		dim = self.embedding_dim or self._emb_matrix.shape[1]
+		if dim and emb.size != dim:
+			# don't store invalid dims
+			return None
+		return emb
 
-		self.vectors.append((f"turn:{convo_id}:{len(self.conversations[convo_id])-1}", convo_id, text, emb, timestamp))
+	def embed_texts(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+		"""Embed several texts (one batch request when supported) and cache the results."""
+		return self._embed_many(texts, [_text_hash(text) for text in texts])
+
+	def _embed_many(self, texts: List[str], keys: List[bytes]) -> List[Optional[np.ndarray]]:
+		"""Embed texts, fetching all uncached ones with a single batch call if possible."""
+		batch_fn = getattr(self.embedding_fn, "batch", None)
+		# batch results are used directly: with a bounded cache, a large batch
+		# may already have been evicted by the time it is read back
+		fetched: Dict[bytes, np.ndarray] = {}
+		if batch_fn is not None:
+			# deduplicate and skip texts that are already cached
+			missing = {}
+			for text, key in zip(texts, keys):
+				if key not in self._emb_cache:
+					missing[key] = text
+			if missing:
+				try:
+					embs = batch_fn(list(missing.values()))
+				except Exception:
+					embs = []
+				for key, emb in zip(missing, embs):
+					emb = np.asarray(emb, dtype=np.float32)
+					if emb.ndim == 1 and emb.size:
+						self._emb_cache[key] = emb
+						fetched[key] = emb
+		# anything the batch call missed (or already cached) goes through _embed
+		return [self._check_dim(fetched[key]) if key in fetched else self._embed(text, key) for text, key in zip(texts, keys)]
 
 	def get_conversation(self, convo_id: str, limit: Optional[int] = None) -> List[Dict]:
 		msgs = self.conversations.get(convo_id, [])
@@ -82,38 +266,57 @@ class MemoryStore:
 	def query_memory(self, query: str, owner: Optional[str] = None, top_k: int = 5) -> List[Dict]:
 		"""Return top_k memory items relevant to the query.
 
-		If embeddings are available, use cosine similarity. Otherwise fall back
-		to simple substring scoring across stored texts.
+		If embeddings are available, score the stored rows of `owner` with one
+		scan over the normalized embedding matrix (see _simkernel). Rows without
+		an embedding fall back to simple substring scoring over the rows that
+		share a token with the query.
 		"""
-		results = []
-		query_emb = None
-		if self.embedding_fn:
-			try:
-				query_emb = self.embedding_fn(query)
-			except Exception:
-				query_emb = None
-
-		for vid, owner_id, text, emb, ts in self.vectors:
-			if owner and owner != owner_id:
-				continue
-			score = 0.0
-			if query_emb and emb:
-				score = _cosine_similarity(query_emb, emb)
-			else:
-				# crude substring / token overlap heuristic
-				q = query.lower()
-				t = text.lower()
-				score = 1.0 if q in t else 0.0
-				# small boost for partial word overlaps
-				if score == 0.0:
-					common = sum(1 for w in set(q.split()) if w in t)
-					score = common / max(1, len(q.split())) * 0.1
-
-			if score > 0:
-				results.append({"id": vid, "owner": owner_id, "text": text, "score": score, "timestamp": ts})
-
-		results.sort(key=lambda r: r["score"], reverse=True)
-		return results[:top_k]
+		n = self._n
+		owner_id = -1
+		if owner:
+			if owner not in self._owner_ids:
+				return []
+			owner_id = self._owner_ids[owner]
+		mask = self._owners[:n] == owner_id if owner_id >= 0 else np.ones(n, dtype=bool)
+
+		scores = np.zeros(n)
+		lexical = mask
+		query_emb = self._embed(query)
+		if query_emb is not None:
+			norm = np.linalg.norm(query_emb)
+			if norm > 0 and self._emb_matrix.shape[1]:
+				q = query_emb / norm
+				if self.quantize:
+					q, q_scale = _quantize(q)
+					scores = masked_scores(self._emb_matrix[:n], q, self._owners[:n], owner_id) * (self._scales[:n] * q_scale)
+				else:
+					scores = masked_scores(self._emb_matrix[:n], q, self._owners[:n], owner_id)
+			lexical = mask & ~self._has_emb[:n]
+
+		if lexical.any():
+			# only rows sharing at least one token with the query can score
+			q = query.lower()
+			q_words = set(q.split())
+			q_len = len(q.split())
+			candidates = set().union(*(self._postings.get(t, ()) for t in set(_TOKEN_RE.findall(q))))
+			for i in candidates:
+				if lexical[i]:
+					scores[i] = _lexical_score(q, q_words, q_len, self._texts[i])
+
+		top = topk(scores, top_k)
+		top = top[scores[top] > 0]
+		return [
+			{
+				"id": self._ids[i],
+				"owner": self._owner_names[o],
+				"text": self._texts[i],
+				"text_hash": self._hashes[i].hex(),
+				"score": s,
+				"timestamp": ts,
+				"formatted_timestamp": self._formatted_ts[i],
+			}
+			for i, o, s, ts in zip(top.tolist(), self._owners[top].tolist(), scores[top].tolist(), self._timestamps[top].tolist())
+		]
 
 	def build_memory_prompt(self, convo_id: str, query: str, k: int = 5) -> str:
 		"""Build a short prompt snippet of relevant memories to include in an LLM prompt.
@@ -121,14 +324,10 @@ class MemoryStore:
 		Returns a string that can be prefixed to the LLM input.
 		"""
 		items = self.query_memory(query, owner=convo_id, top_k=k)
-		parts = []
-		for it in items:
-			t = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(it["timestamp"]))
-			parts.append(f"[{t}] {it['text']}")
-		if not parts:
+		if not items:
 			return ""
 		header = "Relevant past conversation snippets:\n"
-		return header + "\n".join(parts)
+		return header + "\n".join(f"[{it['formatted_timestamp']}] {it['text']}" for it in items)
 
 
 ### Optional: simple Azure OpenAI embeddings helper
@@ -138,6 +337,9 @@ try:
 	def make_azure_embedding_fn(api_key: Optional[str] = None, endpoint: Optional[str] = None, deployment: Optional[str] = None, api_version: str = "2023-07-01-preview") -> Callable[[str], List[float]]:
 		"""Return a callable that computes embeddings via Azure OpenAI (using openai package).
 
+		The callable also has a `batch(texts) -> List[List[float]]` attribute that
+		embeds many texts per request, used by MemoryStore for bulk inserts.
+
 		Usage:
 			emb_fn = make_azure_embedding_fn(api_key, endpoint, deployment)
 			store = MemoryStore(embedding_fn=emb_fn)
@@ -154,6 +356,16 @@ try:
 			resp = Embedding.create(input=text, engine=deployment)
 			return resp["data"][0]["embedding"]
 
+		def emb_batch(texts: List[str]) -> List[List[float]]:
+			from openai import Embedding
+			out: List[List[float]] = []
+			# the embeddings endpoint accepts up to 2048 inputs per request
+			for start in range(0, len(texts), 2048):
+				resp = Embedding.create(input=texts[start:start + 2048], engine=deployment)
+				out.extend(d["embedding"] for d in sorted(resp["data"], key=lambda d: d["index"]))
+			return out
+
+		emb.batch = emb_batch
 		return emb
 except Exception:
 	# openai not available; skip helper
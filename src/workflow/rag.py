@@ -7,96 +7,136 @@ and builds a combined context snippet for LLM prompts.
 
 from typing import List, Dict, Optional, Any, Callable
 import os
-import importlib.util
-import pathlib
+import heapq
+import hashlib
+import threading
 
+from cachetools import TTLCache
 
-def _load_memorystore_class() -> type:
-    """Dynamically load MemoryStore class from src/workflow/memory.py by path.
+from src.workflow.memory import EmbeddingCache, MemoryStore
 
-    This avoids import path issues when running as a script or as a package.
+
+class RagCtx(str):
+    """Context string built by RAGManager.build_rag_context.
+
+    The string itself is the multi-line snippet for prompts; flat is the same
+    text on one line (' | ' between lines), computed once when the context is
+    built.
     """
-    base = pathlib.Path(__file__).resolve().parent
-    candidate = base.parent / 'workflow' / 'memory.py'
-    if not candidate.exists():
-        # Try alternate location if repository layout differs
-        candidate = base.parent.parent / 'src' / 'workflow' / 'memory.py'
-    if not candidate.exists():
-        raise ImportError(f"Memory module not found at expected locations: {candidate}")
-    spec = importlib.util.spec_from_file_location('memory_module', str(candidate))
-    mod = importlib.util.module_from_spec(spec)
-    loader = spec.loader
-    if loader is None:
-        raise ImportError('Could not load memory module loader')
-    loader.exec_module(mod)
-    if not hasattr(mod, 'MemoryStore'):
-        raise ImportError('MemoryStore not found in memory module')
-    return getattr(mod, 'MemoryStore')
-
-
-MemoryStore = _load_memorystore_class()
+
+    def __new__(cls, raw: str = ""):
+        self = super().__new__(cls, raw)
+        self.flat = raw.replace('\n', ' | ')
+        return self
+
+
+_EMPTY_CTX = RagCtx()
 
 
 class RAGManager:
-    def __init__(self, embedding_fn: Optional[Callable[[str], List[float]]] = None, embedding_dim: Optional[int] = None):
+    def __init__(self, embedding_fn: Optional[Callable[[str], List[float]]] = None, embedding_dim: Optional[int] = None, quantize: bool = False):
+        # Embeddings shared by all stores, keyed by text hash (bounded LRU)
+        self.embedding_cache = EmbeddingCache()
         # Global store holds documents for all users
-        self.global_store = MemoryStore(embedding_fn=embedding_fn, embedding_dim=embedding_dim)
+        self.global_store = MemoryStore(embedding_fn=embedding_fn, embedding_dim=embedding_dim, embedding_cache=self.embedding_cache, quantize=quantize)
         # Per-user stores
         self.user_stores = {}  # type: Dict[str, Any]
+        # Short-lived cache of build_rag_context output. Keys include a version
+        # per store, bumped on every insert, so new documents are seen at once.
+        self._ctx_cache = TTLCache(maxsize=4096, ttl=60)
+        # TTLCache is not thread-safe and plan_async builds contexts in worker threads
+        self._ctx_lock = threading.Lock()
+        self._global_version = 0
+        self._user_versions = {}  # type: Dict[str, int]
 
     def _get_user_store(self, user_id: str) -> Any:
         if user_id not in self.user_stores:
-            self.user_stores[user_id] = MemoryStore(embedding_fn=self.global_store.embedding_fn, embedding_dim=self.global_store.embedding_dim)
+            self.user_stores[user_id] = MemoryStore(embedding_fn=self.global_store.embedding_fn, embedding_dim=self.global_store.embedding_dim, embedding_cache=self.embedding_cache, quantize=self.global_store.quantize)
         return self.user_stores[user_id]
 
     def add_global_document(self, doc_id: str, text: str, timestamp: Optional[float] = None):
         # store under a special convo id 'global'
         self.global_store.add_conversation_turn('global', 'system', f"{doc_id}: {text}", timestamp=timestamp)
+        self._global_version += 1
+
+    def add_global_documents_bulk(self, docs: Dict[str, str], timestamp: Optional[float] = None):
+        """Add many global documents, embedding them in a single batch where supported."""
+        self.global_store.add_conversation_turns('global', 'system', [f"{doc_id}: {text}" for doc_id, text in docs.items()], timestamp=timestamp)
+        self._global_version += 1
 
     def add_user_document(self, user_id: str, doc_id: str, text: str, timestamp: Optional[float] = None):
         store = self._get_user_store(user_id)
         store.add_conversation_turn(f'user:{user_id}', 'system', f"{doc_id}: {text}", timestamp=timestamp)
+        self._user_versions[user_id] = self._user_versions.get(user_id, 0) + 1
+
+    def has_documents(self, user_id: Optional[str] = None) -> bool:
+        """True if any global document, or any document for `user_id`, was added."""
+        return bool(self._global_version or (user_id and self._user_versions.get(user_id)))
+
+    def embed_batch(self, texts: List[str]) -> List[Any]:
+        """Embed texts with a single batch request where supported.
+
+        Results land in the embedding cache shared by all stores, so later
+        retrievals for the same texts do not call the embedding backend again.
+        """
+        return self.global_store.embed_texts(texts)
 
     def retrieve(self, query: str, user_id: Optional[str] = None, top_k_global: int = 3, top_k_user: int = 3) -> List[Dict]:
         """Retrieve merged results from global and user stores, sorted by score.
 
-        Returns a list of dicts with fields: id, owner, text, score, timestamp, source
-        where source is 'global' or 'user'.
+        Returns a list of dicts with fields: id, owner, text, text_hash (hex),
+        score, timestamp, formatted_timestamp, source where source is 'global'
+        or 'user'. Equal scores keep global hits ahead of user hits.
         """
-        results = []
         ghits = self.global_store.query_memory(query, owner='global', top_k=top_k_global)
         for r in ghits:
             r['source'] = 'global'
-            results.append(r)
 
-        if user_id:
-            store = self._get_user_store(user_id)
+        uhits = []
+        # users without documents have no store yet; don't create one just to query it
+        store = self.user_stores.get(user_id) if user_id else None
+        if store is not None:
             uhits = store.query_memory(query, owner=f'user:{user_id}', top_k=top_k_user)
             for r in uhits:
                 r['source'] = 'user'
-                results.append(r)
 
-        # de-duplicate by text, prefer user over global if same text
-        seen_texts = set()
+        # both hit lists are already sorted by score: merge them and
+        # de-duplicate by text (compared via its precomputed hash)
+        seen_hashes = set()
         merged = []
-        for r in sorted(results, key=lambda x: x['score'], reverse=True):
-            t = r['text']
-            if t in seen_texts:
+        for r in heapq.merge(ghits, uhits, key=lambda x: x['score'], reverse=True):
+            h = r['text_hash']
+            if h in seen_hashes:
                 continue
-            seen_texts.add(t)
+            seen_hashes.add(h)
             merged.append(r)
 
         return merged
 
-    def build_rag_context(self, query: str, user_id: Optional[str] = None, k_global: int = 3, k_user: int = 3) -> str:
+    def build_rag_context(self, query: str, user_id: Optional[str] = None, k_global: int = 3, k_user: int = 3) -> RagCtx:
+        if not self.has_documents(user_id):
+            # nothing ingested for this caller: skip hashing, cache and retrieval
+            return _EMPTY_CTX
+        key = (
+            hashlib.blake2b(query.encode(), digest_size=8).digest(), user_id, k_global, k_user,
+            self._global_version, self._user_versions.get(user_id, 0) if user_id else 0,
+        )
+        with self._ctx_lock:
+            ctx = self._ctx_cache.get(key)
+        if ctx is not None:
+            return ctx
         hits = self.retrieve(query, user_id=user_id, top_k_global=k_global, top_k_user=k_user)
         if not hits:
-            return ""
-        parts = []
-        for h in hits:
-            parts.append(f"[{h['source'].upper()}] {h['text']}")
-        header = "Relevant documents (RAG):\n"
-        return header + "\n".join(parts)
+            ctx = _EMPTY_CTX
+        else:
+            parts = []
+            for h in hits:
+                parts.append(f"[{h['source'].upper()}] {h['text']}")
+            header = "Relevant documents (RAG):\n"
+            ctx = RagCtx(header + "\n".join(parts))
+        with self._ctx_lock:
+            self._ctx_cache[key] = ctx
+        return ctx
 
 
 if __name__ == '__main__':
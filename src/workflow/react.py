@@ -5,48 +5,124 @@ RAG system for formulas/proofs, uses MemoryStore for conversation/user memory,
 and calls MCP tools (symbolic/numeric) to verify or compute intermediate steps.
 """
 
-from typing import List, Dict, Optional, Any
-import importlib.util
-import pathlib
+from typing import List, Dict, Iterator, Optional, Any, Tuple
+import asyncio
+import collections
+import concurrent.futures
 import json
+import re
+import threading
 import time
 
-
-def _load_module_from_repo(path_parts: List[str], attr: Optional[str] = None):
-    base = pathlib.Path(__file__).resolve().parent
-    candidate = base
-    for p in path_parts:
-        candidate = candidate / p
-    if not candidate.exists():
-        # try from repo root src/
-        candidate = base.parent.parent / 'src'
-        for p in path_parts:
-            candidate = candidate / p
-    if not candidate.exists():
-        raise ImportError(f"Module not found: {'/'.join(path_parts)}")
-    spec = importlib.util.spec_from_file_location('_mod', str(candidate))
-    mod = importlib.util.module_from_spec(spec)
-    loader = spec.loader
-    if loader is None:
-        raise ImportError('Could not load module loader')
-    loader.exec_module(mod)
-    if attr:
-        return getattr(mod, attr)
-    return mod
-
-
-# Load RAGManager dynamically
-RAGManager = _load_module_from_repo(['workflow', 'rag.py'], 'RAGManager')
-# Load MemoryStore from memory module
-MemoryStore = _load_module_from_repo(['workflow', 'memory.py'], 'MemoryStore')
-# Load MCP tools module
-MCP = _load_module_from_repo(['llm', 'mcp.py'])
+from src.workflow.rag import RAGManager, RagCtx
+from src.workflow.memory import MemoryStore
+from src.llm import mcp as MCP
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    # optional compiled decomposition; see _react_fast.pyx for the build command
+    from src.workflow._react_fast import decompose as _decompose_fast
+except ImportError:
+    _decompose_fast = None
+
+
+# Fixed description of the plan layout, shared by every plan
+PLAN_TEMPLATE = (
+    "Work through the steps in order. Each result has a 'step'; when "
+    "verification ran it also has a 'verification' with the tool used and "
+    "its 'result' or 'error'. A leading step may list relevant documents "
+    "retrieved for the problem."
+)
+
+
+def _safe_sympy(step: str) -> Dict:
+    # try symbolic evaluation first
+    ok, value = _cached_sympy(step)
+    if ok:
+        return {"tool": "sympy", "result": value}
+    return {"tool": "sympy", "error": value}
+
+
+def _cached_sympy(step: str) -> Tuple[bool, str]:
+    """Evaluate a step once per process; failures are cached as (False, message).
+
+    Steps differing only in insignificant whitespace ('3 + 4', '3+4', ' 3 + 4 ')
+    share an entry. The first variant seen is the one passed to SymPy.
+    """
+    key = _normalize_step(step)
+    with _sympy_cache_lock:
+        hit = _sympy_cache.get(key)
+        if hit is not None:
+            _sympy_cache.move_to_end(key)
+            return hit
+    try:
+        hit = (True, MCP.sympy_eval(step))
+    except Exception as e:
+        hit = (False, str(e))
+    with _sympy_cache_lock:
+        _sympy_cache[key] = hit
+        if len(_sympy_cache) > _SYMPY_CACHE_SIZE:
+            _sympy_cache.popitem(last=False)
+    return hit
+
+
+def _normalize_step(step: str) -> str:
+    # Whitespace beside brackets and commas, or between an operator and an
+    # operand, never changes how an expression parses ('3 + 4' == '3+4'), so
+    # drop it. Whitespace elsewhere can: '3 . 5' is an error where '3.5' is
+    # not, and '2 * * 3' is not '2**3', so those runs only collapse to one
+    # space. Case is kept: SymPy symbols are case-sensitive.
+    return _WS_RUN.sub(" ", _WS_AROUND_OP.sub("", step)).strip()
+
+
+# LRU of step -> (ok, result or error), keyed on _normalize_step
+_SYMPY_CACHE_SIZE = 4096
+_sympy_cache: "collections.OrderedDict[str, Tuple[bool, str]]" = collections.OrderedDict()
+_sympy_cache_lock = threading.Lock()
+
+
+def _verify_step(step: str) -> Dict:
+    return {"step": step, "verification": _safe_sympy(step)}
+
+
+# Decomposition pattern, compiled once at import. One finditer pass both
+# splits sentences (at .?! followed by whitespace, so '3.5' stays whole) and
+# detects math: the `math` group is set iff the sentence contains a digit or
+# operator. Plain runs are consumed as a block to keep the scan cheap.
+_STEP_RE = re.compile(
+    r"\s*(?P<s>(?:[^.?!0-9=+\-*/^()]+|(?P<math>[0-9=+\-*/^()])|[.?!](?!\s))*"
+    r"(?:[.?!](?=\s)|\Z))"
+)
+_WS_AROUND_OP = re.compile(
+    r"\s+(?=[(),])|(?<=[(),])\s+"
+    r"|(?<=[-+*/^=<>])\s+(?![-+*/^=<>])|(?<![-+*/^=<>])\s+(?=[-+*/^=<>])"
+)
+_WS_RUN = re.compile(r"\s+")
 
 
 class ReActPlanner:
     def __init__(self, embedding_fn: Optional[Any] = None, embedding_dim: Optional[int] = None):
         self.rag = RAGManager(embedding_fn=embedding_fn, embedding_dim=embedding_dim)
-        self.memory = MemoryStore(embedding_fn=embedding_fn, embedding_dim=embedding_dim)
+        # share RAG's content-hash embedding cache so text embedded by one is
+        # never sent to the embedding backend again by the other
+        self.memory = MemoryStore(embedding_fn=embedding_fn, embedding_dim=embedding_dim, embedding_cache=self.rag.embedding_cache)
+        # Verification workers, started on first use and reused across plan()
+        # calls; released by close() (or when the planner is garbage collected)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="react-verify")
+
+    def close(self):
+        """Stop the verification workers. Idle workers exit immediately."""
+        self._pool.shutdown(wait=False)
+
+    def __enter__(self) -> "ReActPlanner":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def add_domain_doc(self, doc_id: str, text: str):
         self.rag.add_global_document(doc_id, text)
@@ -61,59 +137,103 @@ class ReActPlanner:
         1. Retrieve relevant formulas and proofs from global/user RAG.
         2. Propose decomposition into subtasks.
         3. Optionally call MCP tools to compute/verify steps.
-        4. Return structured plan with optional computed results.
+        4. Return structured plan with optional computed results, split as
+           {"static": {"plan_template", "problem"},
+            "dynamic": {"rag_context", "results", "duration"}}.
+           Each result is {"step": ...}, plus a "verification" entry when
+           verify is True.
         """
-        start = time.time()
+        start = time.perf_counter()
         rag_ctx = self.rag.build_rag_context(problem, user_id=user_id)
 
         # Very small heuristic decomposition: split into bullets by sentences and math tokens
         decomposition = self._decompose_problem(problem, rag_ctx)
 
-        # Attempt to verify or compute using MCP tools
-        results = []
-        for step in decomposition:
-            res = {"step": step, "verification": None}
-            if verify:
-                # try symbolic evaluation first
-                try:
-                    sym_result = MCP.sympy_eval(step)
-                    res["verification"] = {"tool": "sympy", "result": sym_result}
-                except Exception as e:
-                    res["verification"] = {"tool": "sympy", "error": str(e)}
-            results.append(res)
+        # Attempt to verify or compute using MCP tools; steps are independent,
+        # so verify them concurrently as the decomposition produces them
+        if not verify:
+            results = [{"step": step} for step in decomposition]
+        else:
+            results = list(self._pool.map(_verify_step, decomposition))
+
+        return self._build_plan(problem, rag_ctx, results, start)
+
+    async def plan_async(self, problem: str, user_id: Optional[str] = None, verify: bool = True) -> Dict:
+        """Async variant of `plan`: retrieval and step verification run in worker
+        threads, with all steps verified concurrently via asyncio.gather."""
+        start = time.perf_counter()
+        rag_ctx = await asyncio.to_thread(self.rag.build_rag_context, problem, user_id=user_id)
+        decomposition = self._decompose_problem(problem, rag_ctx)
+        if verify:
+            results = list(await asyncio.gather(*(asyncio.to_thread(_verify_step, step) for step in decomposition)))
+        else:
+            results = [{"step": step} for step in decomposition]
 
+        return self._build_plan(problem, rag_ctx, results, start)
+
+    def plan_batch(self, problems: List[str], user_ids: Optional[List[Optional[str]]] = None, verify: bool = True) -> List[Dict]:
+        """Plan several problems, embedding all of them with one backend call.
+
+        user_ids, if given, is parallel to problems.
+        """
+        if user_ids is None:
+            user_ids = [None] * len(problems)
+        # warm RAGManager's shared embedding cache in one request; the
+        # retrievals inside plan() then hit the cache instead of the backend.
+        # Skipped when no problem will be retrieved for (nothing ingested).
+        if any(self.rag.has_documents(user_id) for user_id in set(user_ids)):
+            self.rag.embed_batch(problems)
+        return [self.plan(problem, user_id=user_id, verify=verify) for problem, user_id in zip(problems, user_ids)]
+
+    def to_json(self, plan: Dict) -> str:
+        """Serialize a plan compactly (orjson when installed, else stdlib json)."""
+        if orjson is not None:
+            return orjson.dumps(plan).decode()
+        return json.dumps(plan, separators=(",", ":"), ensure_ascii=False)
+
+    def _build_plan(self, problem: str, rag_ctx: RagCtx, results: List[Dict], start: float) -> Dict:
+        # Static fields first: prompts serialized in this order keep the
+        # per-call parts at the end, after a prefix that prompt caches can reuse
         out = {
-            "problem": problem,
-            "rag_context": rag_ctx,
-            "plan": results,
-            "duration": time.time() - start,
+            "static": {
+                "plan_template": PLAN_TEMPLATE,
+                "problem": problem,
+            },
+            "dynamic": {
+                "rag_context": str(rag_ctx),
+                "results": results,
+                "duration": time.perf_counter() - start,
+            },
         }
         return out
 
-    def _decompose_problem(self, problem: str, rag_ctx: str) -> List[str]:
+    def _decompose_problem(self, problem: str, rag_ctx: RagCtx) -> Iterator[str]:
+        if _decompose_fast is not None:
+            return iter(_decompose_fast(problem, rag_ctx.flat))
+        return self._decompose_steps(problem, rag_ctx)
+
+    def _decompose_steps(self, problem: str, rag_ctx: RagCtx) -> Iterator[str]:
         # naive decomposition: split sentences, keep math expressions together
         # Attempt to find math expressions between $...$ or numbers/operators
-        import re
-        sentences = re.split(r"(?<=[\.\?\!])\s+", problem)
-        steps = []
-        for s in sentences:
-            s = s.strip()
+        # RAG hints come first if available
+        if rag_ctx:
+            yield "Consult relevant formulas and proofs: " + rag_ctx.flat
+        for m in _STEP_RE.finditer(problem):
+            s = m.group('s').rstrip()
             if not s:
                 continue
             # if contains equation-like patterns, treat as single step
-            if re.search(r"[0-9=+\-*/^()]+", s):
-                steps.append(s)
+            if m.group('math') is not None:
+                yield s
             else:
                 # break longer sentences into smaller tasks by commas
                 if ',' in s:
-                    parts = [p.strip() for p in s.split(',') if p.strip()]
-                    steps.extend(parts)
+                    for p in s.split(','):
+                        p = p.strip()
+                        if p:
+                            yield p
                 else:
-                    steps.append(s)
-        # prepend RAG hints as the first step if available
-        if rag_ctx:
-            steps.insert(0, "Consult relevant formulas and proofs: " + (rag_ctx.replace('\n', ' | ')))
-        return steps
+                    yield s
 
 
 if __name__ == '__main__':
@@ -125,4 +245,5 @@ if __name__ == '__main__':
 
     problem = 'Find the hypotenuse of a right triangle with legs 3 and 4.'
     plan = planner.plan(problem, user_id='alice')
+    # indented for reading only; use planner.to_json(plan) outside demos
     print(json.dumps(plan, indent=2))
@@ -0,0 +1,58 @@
+import asyncio
+import importlib
+import sys
+import types
+
+import pytest
+
+from src.llm import mcp
+
+
+@pytest.fixture
+def graph_with_fake_langgraph(monkeypatch):
+    # langgraph is optional; a stub exposing Graph and Tool takes the full
+    # LangGraphWrapper path (tool registration and the background tool loop)
+    fake = types.ModuleType("langgraph")
+
+    class Tool:
+        def __init__(self, name, func, description):
+            self.name, self.func = name, func
+
+    class Graph:
+        def __init__(self, agent, tools):
+            self.tools = {t.name: t.func for t in tools}
+
+    fake.Tool, fake.Graph = Tool, Graph
+    monkeypatch.setitem(sys.modules, "langgraph", fake)
+    graph = importlib.reload(importlib.import_module("src.workflow.graph"))
+    yield graph
+    monkeypatch.delitem(sys.modules, "langgraph")
+    importlib.reload(graph)
+
+
+def test_wrapper_close_stops_tool_loop_and_client(graph_with_fake_langgraph):
+    wrapper = graph_with_fake_langgraph.LangGraphWrapper()
+    loop, thread = wrapper._tool_loop, wrapper._tool_thread
+    assert thread.is_alive()
+
+    async def open_client():
+        return mcp._http_client()
+
+    client = asyncio.run_coroutine_threadsafe(open_client(), loop).result()
+    with wrapper:
+        pass
+    assert client.is_closed
+    assert not thread.is_alive()
+    assert loop.is_closed()
+    with pytest.raises(RuntimeError):
+        wrapper.system.planner.plan("x = 1")
+    wrapper.close()  # idempotent
+
+
+def test_system_close_without_langgraph():
+    from src.workflow.graph import LangGraphSystem
+
+    with LangGraphSystem() as system:
+        assert system.solve("x + 1 = 2", verify=False)["static"]["problem"]
+    with pytest.raises(RuntimeError):
+        system.solve("x = 1")
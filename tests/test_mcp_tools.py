@@ -0,0 +1,109 @@
+import pytest
+
+from src.llm.mcp import numpy_eval, sympy_eval
+
+
+def test_sympy_eval_simplifies():
+    assert sympy_eval("sin(x)**2 + cos(x)**2") == "1"
+    assert sympy_eval("1+x") == sympy_eval("x + 1") == "x + 1"
+
+
+def test_sympy_eval_keeps_symbol_assumptions_distinct():
+    # same printed name, different assumptions: must not merge into one symbol
+    # (the two terms print in no fixed order, so check they did not combine)
+    assert sympy_eval('Symbol("x", positive=True) - Symbol("x")') != "0"
+    assert sympy_eval('Symbol("x", positive=True) * Symbol("x")') != "x**2"
+
+
+@pytest.mark.parametrize("expr, expected", [
+    ("Matrix([[1, 2], [3, 4]])", "Matrix([[1, 2], [3, 4]])"),
+    ("{1: x + x}", "{1: 2*x}"),
+])
+def test_sympy_eval_handles_unhashable_results(expr, expected):
+    # twice: a mutable parse result must not be cached and shared
+    assert sympy_eval(expr) == expected
+    assert sympy_eval(expr) == expected
+
+
+def test_sympy_eval_reports_parse_errors():
+    assert sympy_eval("(").startswith("SymPy error:")
+
+
+def test_numpy_eval_allowlisted_expressions():
+    assert numpy_eval("np.sin(np.pi/2)") == "1.0"
+    assert numpy_eval("np.linalg.norm([3, 4])") == "5.0"
+    assert numpy_eval("np.array([1, 2, 3]).sum()") == "6"
+    assert numpy_eval("np.array([[1, 2], [3, 4]]).T.shape") == "(2, 2)"
+
+
+@pytest.mark.parametrize("expr", [
+    "np.f2py.os.getcwd()",
+    "np.f2py.os.system('true')",
+    "np.ctypeslib.ctypes.CDLL(None).getpid()",
+    "np.array([1]).ctypes",
+    "np.load('x.npy')",
+    "np.sum.__self__",
+    "(1).__class__",
+    "__import__('os')",
+    "np",
+    "[x for x in [1]]",
+])
+def test_numpy_eval_rejects_escapes(expr):
+    assert numpy_eval(expr).startswith("NumPy error:")
+
+
+def _mock_httpx(monkeypatch, handler):
+    import httpx
+
+    real_client = httpx.AsyncClient
+
+    def client(*args, **kwargs):
+        kwargs.pop("http2", None)
+        return real_client(*args, transport=httpx.MockTransport(handler), **kwargs)
+
+    monkeypatch.setattr(httpx, "AsyncClient", client)
+
+
+def test_http_client_is_per_event_loop(monkeypatch):
+    import asyncio
+    import httpx
+
+    from src.llm.mcp import _http_client, mathjs_eval
+
+    _mock_httpx(monkeypatch, lambda request: httpx.Response(200, text="42"))
+
+    async def call():
+        assert await mathjs_eval("6*7") == "42"
+        return _http_client()
+
+    # each asyncio.run has its own loop; a client must never be reused across them
+    assert asyncio.run(call()) is not asyncio.run(call())
+
+
+def test_lifespan_closes_client_after_last_session():
+    import asyncio
+
+    from src.llm.mcp import _http_client, _lifespan
+
+    async def serve():
+        async with _lifespan(None):
+            async with _lifespan(None):
+                client = _http_client()
+            assert not client.is_closed
+        return client
+
+    assert asyncio.run(serve()).is_closed
+
+
+def test_web_tools_report_transport_errors(monkeypatch):
+    import asyncio
+    import httpx
+
+    from src.llm.mcp import mathjs_eval, wolfram_query
+
+    def fail(request):
+        raise httpx.ConnectError("unreachable", request=request)
+
+    _mock_httpx(monkeypatch, fail)
+    assert asyncio.run(mathjs_eval("1+1")) == "MathJS error: unreachable"
+    assert asyncio.run(wolfram_query("2+2 uncached", "app")) == "WolframAlpha error: unreachable"
@@ -0,0 +1,138 @@
+import numpy as np
+
+from src.workflow.memory import EmbeddingCache, MemoryStore
+from src.workflow.rag import RAGManager
+
+
+def _hash_embedding(dim=8):
+    """Deterministic toy embedding that records how it was called."""
+    calls = {"single": 0, "batch": 0}
+
+    def emb(text):
+        calls["single"] += 1
+        rng = np.random.default_rng(abs(hash(text)) % (2 ** 32))
+        return rng.standard_normal(dim).tolist()
+
+    def batch(texts):
+        calls["batch"] += 1
+        calls["single"] -= len(texts)
+        return [emb(t) for t in texts]
+
+    emb.batch = batch
+    return emb, calls
+
+
+def test_embedding_cache_is_bounded_lru():
+    cache = EmbeddingCache(maxsize=2)
+    cache[b"a"] = np.ones(1)
+    cache[b"b"] = np.ones(1)
+    cache.get(b"a")
+    cache[b"c"] = np.ones(1)
+    assert b"a" in cache and b"c" in cache and b"b" not in cache
+
+
+def test_query_embeddings_do_not_grow_cache_without_limit():
+    emb, _ = _hash_embedding()
+    rag = RAGManager(embedding_fn=emb, embedding_dim=8)
+    rag.add_global_document("d", "some document")
+    for i in range(3000):
+        rag.retrieve(f"query {i}")
+    assert len(rag.embedding_cache) <= rag.embedding_cache.maxsize
+
+
+def test_bulk_ingest_larger_than_cache_uses_one_batch_call():
+    emb, calls = _hash_embedding()
+    store = MemoryStore(embedding_fn=emb, embedding_dim=8, embedding_cache=EmbeddingCache(maxsize=16))
+    store.add_conversation_turns("c", "system", [f"doc {i}" for i in range(100)])
+    assert calls == {"single": 0, "batch": 1}
+    assert store.query_memory("doc 42", top_k=1)[0]["text"] == "doc 42"
+
+
+def test_quantized_store_matches_float32_retrieval():
+    rng = np.random.default_rng(0)
+    base = rng.standard_normal((1000, 256)).astype(np.float32)
+    noise = rng.standard_normal((50, 256)).astype(np.float32)
+
+    def emb(text):
+        kind, i = text.split()
+        i = int(i)
+        return base[i] if kind == "doc" else base[i * 17] + 0.7 * noise[i]
+
+    cache = EmbeddingCache()
+    exact = MemoryStore(embedding_fn=emb, embedding_cache=cache)
+    quant = MemoryStore(embedding_fn=emb, embedding_cache=cache, quantize=True)
+    docs = [f"doc {i}" for i in range(1000)]
+    exact.add_conversation_turns("c", "user", docs)
+    quant.add_conversation_turns("c", "user", docs)
+    assert quant._emb_matrix.nbytes * 4 == exact._emb_matrix.nbytes
+
+    recall, max_err = 0.0, 0.0
+    for j in range(50):
+        a = {h["text"]: h["score"] for h in exact.query_memory(f"q {j}", top_k=10)}
+        b = {h["text"]: h["score"] for h in quant.query_memory(f"q {j}", top_k=10)}
+        common = a.keys() & b.keys()
+        recall += len(common) / 10 / 50
+        max_err = max([max_err] + [abs(a[t] - b[t]) for t in common])
+    assert recall >= 0.9
+    assert max_err < 0.01
+
+
+def test_query_memory_from_worker_threads():
+    import threading
+
+    emb, _ = _hash_embedding()
+    store = MemoryStore(embedding_fn=emb, embedding_dim=8)
+    for i in range(200):
+        store.add_conversation_turn(f"c{i % 3}", "user", f"turn {i}")
+        store.add_conversation_turn("shared", "user", f"shared {i}")
+    # owner filter over a multi-owner store: the filtered (kernel) scan path
+    expected = store.query_memory("turn 7", owner="c1", top_k=3)
+    assert expected and all(h["owner"] == "c1" for h in expected)
+    results, errors = [], []
+
+    def work():
+        try:
+            for _ in range(50):
+                results.append(store.query_memory("turn 7", owner="c1", top_k=3))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert all(r == expected for r in results)
+
+
+def test_lexical_fallback_filters_by_owner():
+    store = MemoryStore()
+    store.add_conversation_turn("a", "user", "alpha beta")
+    store.add_conversation_turn("b", "user", "alpha gamma")
+    hits = store.query_memory("alpha", owner="a")
+    assert [h["text"] for h in hits] == ["alpha beta"]
+    assert store.query_memory("alpha", owner="missing") == []
+
+
+def test_lexical_fallback_only_scores_rows_without_embeddings():
+    def emb(text):
+        if text.startswith("plain"):
+            raise RuntimeError("no embedding for this row")
+        # stored rows point one way, queries the other: cosine score 0
+        return [1.0, 0.0] if text.startswith("vec") else [0.0, 1.0]
+
+    store = MemoryStore(embedding_fn=emb, embedding_dim=2)
+    store.add_conversation_turn("c", "user", "vec alpha")
+    store.add_conversation_turn("c", "user", "plain alpha")
+    hits = store.query_memory("alpha")
+    assert [h["text"] for h in hits] == ["plain alpha"]
+
+
+def test_lexical_fallback_needs_a_shared_token():
+    store = MemoryStore()
+    store.add_conversation_turn("c", "user", "alpha beta")
+    assert store.query_memory("delta epsilon") == []
+    # candidates come from whole tokens: a bare substring does not match
+    assert store.query_memory("alp") == []
+    assert store.query_memory("Beta")[0]["text"] == "alpha beta"
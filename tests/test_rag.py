@@ -0,0 +1,80 @@
+import json
+import sys
+import threading
+
+from cachetools import TTLCache
+
+from src.workflow.rag import RAGManager
+
+
+def test_build_rag_context_is_thread_safe():
+    # force frequent thread switches and constant TTL evictions
+    old = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        rag = RAGManager()
+        rag._ctx_cache = TTLCache(maxsize=4, ttl=0.001)
+        for i in range(20):
+            rag.add_global_document(f"d{i}", f"text number {i} about x")
+        errors = []
+
+        def work(t):
+            try:
+                for i in range(2000):
+                    rag.build_rag_context(f"x {i % 37} {t}")
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(t,)) for t in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(old)
+    assert errors == []
+
+
+def test_build_rag_context_sees_new_documents():
+    rag = RAGManager()
+    rag.add_global_document("a", "alpha notes")
+    assert "alpha" in rag.build_rag_context("alpha")
+    rag.add_user_document("u", "b", "alpha for user")
+    assert "[USER]" in rag.build_rag_context("alpha", user_id="u")
+
+
+def test_retrieve_merges_by_score_and_dedups_text():
+    rag = RAGManager()
+    rag.add_global_document("thm", "alpha beta")
+    rag.add_global_document("other", "alpha gamma")
+    rag.add_user_document("u", "thm", "alpha beta")  # same text as the global doc
+    rag.add_user_document("u", "mine", "alpha beta delta")
+    hits = rag.retrieve("alpha beta", user_id="u")
+    assert [(h["source"], h["text"]) for h in hits] == [
+        ("global", "thm: alpha beta"),
+        ("user", "mine: alpha beta delta"),
+        ("global", "other: alpha gamma"),
+    ]
+    assert [h["score"] for h in hits] == sorted((h["score"] for h in hits), reverse=True)
+    # the public hits (e.g. returned by the rag_lookup tool) serialize as JSON
+    assert json.loads(json.dumps(hits)) == hits
+
+
+def test_retrieve_ties_keep_global_first():
+    rag = RAGManager()
+    rag.add_global_document("g", "alpha beta")
+    rag.add_user_document("u", "v", "alpha beta")
+    hits = rag.retrieve("alpha beta", user_id="u")
+    assert [h["source"] for h in hits] == ["global", "user"]
+    assert hits[0]["score"] == hits[1]["score"]
+
+
+def test_rag_context_is_a_string():
+    rag = RAGManager()
+    rag.add_global_document("a", "alpha notes")
+    ctx = rag.build_rag_context("alpha")
+    assert isinstance(ctx, str)
+    assert ("Context: " + ctx).endswith("[GLOBAL] a: alpha notes")
+    assert ctx.replace("\n", " | ") == ctx.flat == "Relevant documents (RAG): | [GLOBAL] a: alpha notes"
+    assert json.loads(json.dumps(ctx)) == ctx
+    assert not RAGManager().build_rag_context("alpha")
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import random
+import re
+
+import pytest
+
+from src.workflow import react
+from src.workflow.rag import RagCtx
+from src.workflow.react import ReActPlanner, _decompose_fast, _normalize_step, _safe_sympy
+
+_EMPTY = RagCtx()
+_HINT = RagCtx("Relevant documents (RAG):\nA = pi * r^2")
+
+_SENT_SPLIT = re.compile(r"(?<=[\.\?\!])\s+")
+_MATH_RE = re.compile(r"[0-9=+\-*/^()]+")
+
+
+def _reference_decompose(problem, rag_ctx):
+    """The original split-then-search decomposition (before chunk1-9)."""
+    steps = []
+    if rag_ctx:
+        steps.append("Consult relevant formulas and proofs: " + rag_ctx.flat)
+    for s in _SENT_SPLIT.split(problem):
+        s = s.strip()
+        if not s:
+            continue
+        if _MATH_RE.search(s):
+            steps.append(s)
+        elif "," in s:
+            steps.extend(p.strip() for p in s.split(",") if p.strip())
+        else:
+            steps.append(s)
+    return steps
+
+
+def _random_problems(n, seed):
+    rng = random.Random(seed)
+    alphabet = "ab x,.?!  \t\n\x1c1+=()\u00e9"
+    for _ in range(n):
+        yield "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 24)))
+
+
+@pytest.fixture(scope="module")
+def planner():
+    with ReActPlanner() as p:
+        yield p
+
+
+def test_decompose_keeps_decimals_and_splits_plain_commas(planner):
+    problem = "Simplify x + x + 2*x.  Then, compute 3.5 * 2!  What is the area of a circle, radius, and diameter?"
+    assert list(planner._decompose_steps(problem, _EMPTY)) == [
+        "Simplify x + x + 2*x.",
+        "Then, compute 3.5 * 2!",
+        "What is the area of a circle",
+        "radius",
+        "and diameter?",
+    ]
+    assert next(planner._decompose_steps("x", _HINT)) == "Consult relevant formulas and proofs: " + _HINT.flat
+
+
+def test_decompose_matches_reference(planner):
+    for problem in _random_problems(20000, seed=0):
+        for ctx in (_EMPTY, _HINT):
+            assert list(planner._decompose_steps(problem, ctx)) == _reference_decompose(problem, ctx), repr(problem)
+
+
+@pytest.mark.skipif(_decompose_fast is None, reason="_react_fast extension not built")
+def test_compiled_decompose_matches_python(planner):
+    for problem in _random_problems(20000, seed=1):
+        for ctx in (_EMPTY, _HINT):
+            assert _decompose_fast(problem, ctx.flat) == list(planner._decompose_steps(problem, ctx)), repr(problem)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("3 + 4", "3+4"),
+    (" 3+4 ", "3+4"),
+    ("sin( x ) ** 2", "sin(x)**2"),
+    ("f (x , y)", "f(x,y)"),
+])
+def test_normalize_step_merges_equivalent_spacing(a, b):
+    assert _normalize_step(a) == _normalize_step(b)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("3 . 5", "3.5"),
+    ("2 * * 3", "2**3"),
+    ("2 x", "2x"),
+    ("X + 1", "x + 1"),
+])
+def test_normalize_step_keeps_significant_differences(a, b):
+    assert _normalize_step(a) != _normalize_step(b)
+
+
+def test_cached_verification_does_not_depend_on_first_variant():
+    assert _safe_sympy("3 . 5")["result"].startswith("SymPy error")
+    assert _safe_sympy("3.5")["result"] == "3.50000000000000"
+
+
+def _counting_embedding():
+    calls = {"single": 0, "batch": 0}
+
+    def emb(text):
+        calls["single"] += 1
+        return [float(len(text)), 1.0, 0.5]
+
+    def batch(texts):
+        calls["batch"] += 1
+        return [[float(len(t)), 1.0, 0.5] for t in texts]
+
+    emb.batch = batch
+    return emb, calls
+
+
+def test_plan_batch_skips_embedding_without_documents():
+    emb, calls = _counting_embedding()
+    with ReActPlanner(embedding_fn=emb, embedding_dim=3) as p:
+        plans = p.plan_batch(["x + 1", "y + 2"], user_ids=["u", None], verify=False)
+        assert [plan["dynamic"]["rag_context"] for plan in plans] == ["", ""]
+        assert calls == {"single": 0, "batch": 0}
+
+
+def test_plan_batch_embeds_once_with_documents():
+    emb, calls = _counting_embedding()
+    with ReActPlanner(embedding_fn=emb, embedding_dim=3) as p:
+        p.add_user_note("u", "n", "note")
+        p.plan_batch(["x + 1", "y + 2"], user_ids=["u", None], verify=False)
+        # one batch for the problems; the note itself was embedded on insert
+        assert calls == {"single": 1, "batch": 1}
+
+
+def test_to_json_matches_stdlib_fallback(planner, monkeypatch):
+    plan = planner.plan("Find θ, given 2*x = 4.5.", verify=True)
+    fast = planner.to_json(plan)
+    monkeypatch.setattr(react, "orjson", None)
+    assert planner.to_json(plan) == fast
+    assert json.loads(fast) == plan
+
+
+def test_close_stops_verification_workers():
+    with ReActPlanner() as p:
+        p.plan("x + 1 = 2. y = 3.")
+        workers = list(p._pool._threads)
+        assert workers
+    for t in workers:
+        t.join(timeout=5)
+        assert not t.is_alive()
+    with pytest.raises(RuntimeError):
+        p.plan("x + 1 = 2")
+    p.close()  # idempotent
+
+
+def test_plan_async_matches_plan():
+    emb, calls = _counting_embedding()
+    with ReActPlanner(embedding_fn=emb, embedding_dim=3) as p:
+        p.rag.add_global_document("area", "A = pi * r^2")
+        problem = "The radius is 2. Compute A = pi * r^2."
+        plan = asyncio.run(p.plan_async(problem))
+        assert "A = pi * r^2" in plan["dynamic"]["rag_context"]
+        assert calls["single"] == 2  # the document, then the problem
+        steps = [r["step"] for r in plan["dynamic"]["results"]]
+        assert steps[0].startswith("Consult relevant formulas")
+        assert all("verification" in r for r in plan["dynamic"]["results"])
+        sync = p.plan(problem)
+        assert plan["static"] == sync["static"]
+        assert plan["dynamic"]["rag_context"] == sync["dynamic"]["rag_context"]
+        assert plan["dynamic"]["results"] == sync["dynamic"]["results"]
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from src.workflow._simkernel import masked_scores, topk
+
+
+def test_topk_matches_stable_sort_on_ties():
+    rng = np.random.default_rng(0)
+    for _ in range(2000):
+        n = int(rng.integers(0, 50))
+        k = int(rng.integers(0, 60))
+        # lexical fallback scores: mostly ties
+        scores = rng.choice([0.0, 0.05, 0.1, 1.0], size=n)
+        expected = np.argsort(-scores, kind="stable")[:k]
+        assert np.array_equal(topk(scores, k), expected)
+
+
+def test_topk_prefers_earliest_rows_at_the_cut():
+    scores = np.array([0.5, 1.0, 0.5, 0.5, 1.0, 0.5])
+    assert topk(scores, 3).tolist() == [1, 4, 0]
+
+
+def test_masked_scores_filters_owner():
+    mat = np.eye(3, dtype=np.float32)
+    q = np.array([1.0, 1.0, 1.0], dtype=np.float32)
+    owners = np.array([0, 1, 0], dtype=np.int32)
+    assert masked_scores(mat, q, owners, 0).tolist() == [1.0, 0.0, 1.0]
+    assert masked_scores(mat, q, owners, -1).tolist() == [1.0, 1.0, 1.0]
+
+
+def _reference_scores(mat, q, owners, owner_id):
+    out = mat.astype(np.float64) @ q.astype(np.float64)
+    if owner_id >= 0:
+        out[owners != owner_id] = 0.0
+    return out
+
+
+@pytest.mark.parametrize("use_kernel", [True, False])
+def test_masked_scores_paths_agree(monkeypatch, use_kernel):
+    from src.workflow import _simkernel
+
+    if not use_kernel:
+        monkeypatch.setattr(_simkernel, "_kernel_scores", None)
+    elif _simkernel._kernel_scores is None:
+        pytest.skip("numba not installed")
+    rng = np.random.default_rng(1)
+    owners = rng.integers(0, 3, 300).astype(np.int32)
+    cases = [
+        (rng.standard_normal((300, 16)).astype(np.float32), rng.standard_normal(16).astype(np.float32)),
+        (rng.integers(-127, 128, (300, 16)).astype(np.int8), rng.integers(-127, 128, 16).astype(np.int8)),
+    ]
+    for mat, q in cases:
+        for own, owner_id in ((owners, -1), (owners, 1), (owners, 9), (np.zeros(300, np.int32), 0)):
+            got = _simkernel.masked_scores(mat, q, own, owner_id)
+            assert np.allclose(got, _reference_scores(mat, q, own, owner_id), rtol=1e-4, atol=1e-3)